@@ -1,12 +1,15 @@
 import json
 import logging
 import pathlib
+import string
 from typing import Any
 
 from miniboss.exceptions import ContextError
 
 logger = logging.getLogger(__name__)
 
+_formatter = string.Formatter()
+
 
 class _Context(dict[str, Any]):
     filename = ".miniboss-context"
@@ -35,8 +38,12 @@ class _Context(dict[str, Any]):
     def extrapolate(self, env_value: Any) -> Any:
         if not hasattr(env_value, "format"):
             return env_value
+        if "{" not in env_value and "}" not in env_value:
+            return env_value
         try:
-            return env_value.format(**self)
+            # vformat looks keys up in the context directly instead of
+            # copying it into keyword arguments for every value
+            return _formatter.vformat(env_value, (), self)
         except KeyError:
             keys = ",".join(self.keys())
             exc = ContextError(
@@ -50,7 +57,7 @@ class _Context(dict[str, Any]):
             )
             raise exc from None
         except IndexError:
-            msg = "Only keyword argument extrapolation allowed, violating string: '{env_value}'"
+            msg = f"Only keyword argument extrapolation allowed, violating string: '{env_value}'"
             raise ContextError(msg) from None
 
     def extrapolate_values(self, a_dict: dict[str, Any]) -> dict[str, Any]:
@@ -1,50 +1,113 @@
 from __future__ import annotations
 
 import logging
-import random
+import secrets
+import threading
 import time
-from typing import TYPE_CHECKING, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, Optional
 
 import docker  # type: ignore
 import docker.errors  # type: ignore
 
 from miniboss.exceptions import ContainerStartException, DockerException
-from miniboss.types import Network
+from miniboss.types import DEFAULT_MAX_PARALLEL_RUNS, Network
 
 if TYPE_CHECKING:
     from miniboss.services import Service
 
 logger = logging.getLogger(__name__)
 
-DIGITS = "0123456789"
+# How long a freshly started container is watched for an early exit at most
+# (seconds)
+START_SETTLE_TIME = 1
+# A container that has been running this long is considered started (seconds)
+START_RUNNING_TIME = 0.2
+
+# Read timeout for requests to the Docker daemon (seconds). The library default
+# of 60 seconds is too short for a daemon busy with parallel starts and pulls.
+# Stop requests are extended by the stop timeout by docker-py itself.
+CLIENT_TIMEOUT = 120
 
 _the_docker: Optional[docker.DockerClient] = None
+_the_docker_lock = threading.Lock()
+
+
+def _create_lib_client(max_parallel_runs: int) -> docker.DockerClient:
+    # The HTTP connection pool to the Docker daemon has to accommodate the
+    # agents running in parallel, and the main thread
+    return docker.from_env(max_pool_size=2 * max_parallel_runs, timeout=CLIENT_TIMEOUT)
 
 
 class DockerClient:
     def __init__(self, lib_client: docker.DockerClient):
         self.lib_client = lib_client
+        self.max_parallel_runs = DEFAULT_MAX_PARALLEL_RUNS
+        # The number of parallel runs the connection pool was sized for
+        self._pool_runs = DEFAULT_MAX_PARALLEL_RUNS
+        self.run_semaphore = threading.BoundedSemaphore(DEFAULT_MAX_PARALLEL_RUNS)
+        # Image checks running in the background, by image tag
+        self._image_checks: dict[str, Future] = {}
 
     @classmethod
     def get_client(cls) -> DockerClient:
         global _the_docker
         if _the_docker is None:
-            _the_docker = cls(docker.from_env())
+            # Agents call this from worker threads; only one client (and
+            # connection pool) should ever be created
+            with _the_docker_lock:
+                if _the_docker is None:
+                    _the_docker = cls(_create_lib_client(DEFAULT_MAX_PARALLEL_RUNS))
         return _the_docker
 
-    def create_network(self, network_name: str) -> docker.models.networks.Network:
-        existing = self.lib_client.networks.list(names=[network_name])
-        if existing:
-            network = existing[0]
+    def limit_parallel_runs(self, limit: int) -> None:
+        """Set the maximum number of containers that can be started or stopped at
+        the same time. Should be called before any agents are started."""
+        if limit < 1:
+            raise DockerException(
+                f"Parallel run limit has to be at least 1, not {limit}"
+            )
+        if limit > self._pool_runs:
+            # The connection pool is too small for this many parallel runs
+            self.lib_client.close()
+            self.lib_client = _create_lib_client(limit)
+            self._pool_runs = limit
+        self.max_parallel_runs = limit
+        self.run_semaphore = threading.BoundedSemaphore(limit)
+
+    def get_network(
+        self, network_name: str
+    ) -> Optional[docker.models.networks.Network]:
+        # Inspecting a network by name is a direct lookup, as opposed to
+        # listing all networks and filtering them
+        try:
+            network = self.lib_client.networks.get(network_name)
+        except docker.errors.NotFound:
+            return None
+        except docker.errors.APIError:
+            # The name is ambiguous if there are multiple networks with it, in
+            # which case the daemon refuses to inspect it
+            pass
         else:
+            # The daemon also matches the name against the start of network
+            # IDs, which can return an unrelated network
+            if network.name == network_name:
+                return network
+        networks = self.lib_client.networks.list(names=[network_name])
+        matching = [network for network in networks if network.name == network_name]
+        return matching[0] if matching else None
+
+    def create_network(self, network_name: str) -> docker.models.networks.Network:
+        network = self.get_network(network_name)
+        if network is None:
             network = self.lib_client.networks.create(network_name, driver="bridge")
             logger.info("Created network %s", network_name)
         return network
 
     def remove_network(self, network_name: str) -> None:
-        networks = self.lib_client.networks.list(names=[network_name])
-        if networks:
-            networks[0].remove()
+        network = self.get_network(network_name)
+        if network is not None:
+            network.remove()
             logger.info("Removed network %s", network_name)
 
     def existing_on_network(
@@ -54,6 +117,26 @@ class DockerClient:
             all=True, filters={"network": network.id, "name": name}
         )
 
+    def containers_on_network(
+        self, network: Network
+    ) -> dict[str, list[docker.models.containers.Container]]:
+        """Return all containers on the network, grouped by name prefix, i.e. the
+        container name without the random suffix."""
+        by_prefix: dict[str, list[docker.models.containers.Container]] = {}
+        if not network.id:
+            # The daemon matches network IDs by prefix, so an empty ID would
+            # list the containers on all networks
+            return by_prefix
+        # Containers removed while the list is being built are skipped instead
+        # of raising an error
+        containers = self.lib_client.containers.list(
+            all=True, filters={"network": network.id}, ignore_removed=True
+        )
+        for container in containers:
+            name_prefix = container.name.rsplit("-", 1)[0]
+            by_prefix.setdefault(name_prefix, []).append(container)
+        return by_prefix
+
     def build_image(self, build_dir, dockerfile, image_tag):
         try:
             self.lib_client.images.build(
@@ -66,26 +149,53 @@ class DockerClient:
                 f"Error building image: {api_error.explanation}"
             ) from None
 
-    def run_container(self, container_id: str):
-        # The container should be already created but not in state running or starting
-        try:
-            self.lib_client.api.start(container_id)
-        except docker.errors.APIError as api_error:
-            # This might be e.g. due to cgroups errors
-            msg = f"Error starting container {container_id}: {api_error.explanation}"
-            raise DockerException(msg) from None
-        # Let's wait a little because the status of the container is
-        # not set right away
-        time.sleep(1)
+    def _inspect_container(self, container_id: str) -> dict:
         try:
-            container = self.lib_client.containers.get(container_id)
+            return self.lib_client.api.inspect_container(container_id)
         except docker.errors.NotFound:
             msg = f"Something went terribly wrong: Could not find container {container_id}"
             raise DockerException(msg) from None
-        if container.status != "running":
-            logs = self.lib_client.api.logs(container.id).decode("utf-8")
-            raise ContainerStartException(logs, container.name)
-        return container
+
+    def run_container(self, container_id: str) -> None:
+        # The container should be already created but not in state running or
+        # starting. Only the start request counts against the parallel runs;
+        # watching the container afterwards does not load the daemon.
+        with self.run_semaphore:
+            try:
+                self.lib_client.api.start(container_id)
+            except docker.errors.APIError as api_error:
+                # This might be e.g. due to cgroups errors
+                msg = (
+                    f"Error starting container {container_id}: {api_error.explanation}"
+                )
+                raise DockerException(msg) from None
+        self._watch_started_container(container_id)
+
+    def _watch_started_container(self, container_id: str) -> None:
+        # The container can still exit right after starting, so we watch it,
+        # backing off between checks, until it has been running for a while or
+        # it exits. The raw inspect payload is enough for this; no need for a
+        # container model.
+        deadline = time.monotonic() + START_SETTLE_TIME
+        delay = 0.01
+        running_since = None
+        info = self._inspect_container(container_id)
+        while info["State"]["Status"] in ("created", "running"):
+            now = time.monotonic()
+            if info["State"]["Status"] == "running":
+                if running_since is None:
+                    running_since = now
+                elif now - running_since >= START_RUNNING_TIME:
+                    break
+            remaining = deadline - now
+            if remaining <= 0:
+                break
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, START_RUNNING_TIME / 2)
+            info = self._inspect_container(container_id)
+        if info["State"]["Status"] != "running":
+            logs = self.lib_client.api.logs(container_id).decode("utf-8")
+            raise ContainerStartException(logs, info["Name"].lstrip("/"))
 
     def check_image(self, tag):
         try:
@@ -103,11 +213,68 @@ class DockerClient:
             )
             raise DockerException(msg) from None
 
+    def _check_image_in_advance(self, tag) -> Optional[DockerException]:
+        try:
+            self.check_image(tag)
+        except DockerException as exc:
+            # The error will be reported when the service is started
+            logger.info("Could not pull image %s in advance: %s", tag, exc)
+            return exc
+        return None
+
+    def check_images(self, tags: Iterable[str]) -> None:
+        """Start making sure that the images are available locally, pulling the
+        missing ones in parallel in the background. Creating a container for a
+        service waits only for the image of that service."""
+        tags = set(tags)
+        if not tags:
+            return
+        max_workers = min(len(tags), self.max_parallel_runs)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        for tag in tags:
+            self._image_checks[tag] = executor.submit(self._check_image_in_advance, tag)
+        # The checks that are not needed any more are cancelled with
+        # cancel_image_checks
+        executor.shutdown(wait=False)
+
+    def cancel_image_checks(self) -> None:
+        """Cancel the image checks that have not started yet. Pulls that are
+        already in progress cannot be interrupted, and run to completion."""
+        for image_check in self._image_checks.values():
+            image_check.cancel()
+        self._image_checks = {}
+
+    def _wait_for_image_check(self, tag: str) -> None:
+        image_check = self._image_checks.get(tag)
+        if image_check is None or image_check.cancelled():
+            return
+        error = image_check.result()
+        if error is not None:
+            # No point in pulling the image a second time
+            raise error
+
+    def _create_container(self, image: str, kw_arguments: dict):
+        # Images are pulled while the services are started, so instead of
+        # checking for the image first, it is pulled only if creation fails.
+        # Only the create requests take up one of the parallel runs, not the
+        # pull.
+        try:
+            with self.run_semaphore:
+                return self.lib_client.api.create_container(image, **kw_arguments)
+        except docker.errors.ImageNotFound:
+            pass
+        self.check_image(image)
+        with self.run_semaphore:
+            try:
+                return self.lib_client.api.create_container(image, **kw_arguments)
+            except docker.errors.ImageNotFound:
+                msg = f"Image {image:s} could not be found; please make sure it exists"
+                raise DockerException(msg) from None
+
     def run_service_on_network(
         self, name_prefix, service: Service, network: Network
     ) -> str:
-        random_suffix = "".join(random.sample(DIGITS, 4))
-        container_name = f"{name_prefix}-{random_suffix}"
+        container_name = f"{name_prefix}-{secrets.token_hex(2)}"
         networking_config = self.lib_client.api.create_networking_config(
             {
                 network.name: self.lib_client.api.create_endpoint_config(
@@ -118,7 +285,6 @@ class DockerClient:
         host_config = self.lib_client.api.create_host_config(
             port_bindings=service.ports, binds=service.volumes
         )
-        self.check_image(service.image)
         kw_arguments = {
             "detach": True,
             "name": container_name,
@@ -135,15 +301,11 @@ class DockerClient:
             kw_arguments["command"] = service.cmd
         if service.user:
             kw_arguments["user"] = service.user
-        try:
-            container = self.lib_client.api.create_container(
-                service.image, **kw_arguments
-            )
-        except docker.errors.ImageNotFound:
-            msg = f"Image {service.image:s} could not be found; please make sure it exists"
-            raise DockerException(msg) from None
-        container = self.run_container(container.get("Id"))
+        # A pull in progress should not take up one of the parallel runs
+        self._wait_for_image_check(service.image)
+        container_id = self._create_container(service.image, kw_arguments)["Id"]
+        self.run_container(container_id)
         logger.info(
-            "Started container id %s for service %s", container.id, service.name
+            "Started container id %s for service %s", container_id, service.name
         )
         return container_name
@@ -4,6 +4,7 @@ import click
 
 from miniboss import services
 from miniboss.exceptions import MinibossCLIError
+from miniboss.types import DEFAULT_MAX_PARALLEL_RUNS
 
 
 @click.group()
@@ -11,6 +12,14 @@ def cli():
     pass
 
 
+max_parallel_runs_option = click.option(
+    "--max-parallel-runs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_PARALLEL_RUNS,
+    help="Maximum number of containers started or stopped at the same time",
+)
+
+
 def get_main_directory() -> str:
     """Return the path to the directory where the main script is located. If the cli
     function is being called from a Python shell, this function will raise an
@@ -31,11 +40,19 @@ def get_main_directory() -> str:
 @click.option(
     "--timeout", type=int, default=300, help="Timeout for starting a service (seconds)"
 )
-def start(exclude: str, network_name: str, timeout: int):
+@max_parallel_runs_option
+def start(exclude: str, network_name: str, timeout: int, max_parallel_runs: int):
     excluded = exclude.split(",") if exclude else []
-    services.start_services(get_main_directory(), excluded, network_name, timeout)
+    services.start_services(
+        get_main_directory(),
+        excluded,
+        network_name,
+        timeout,
+        max_parallel_runs=max_parallel_runs,
+    )
 
 
+# pylint: disable=too-many-arguments
 @cli.command()
 @click.option("--exclude", help="Names of services to exclude (comma-separated)")
 @click.option(
@@ -47,10 +64,23 @@ def start(exclude: str, network_name: str, timeout: int):
 @click.option(
     "--timeout", type=int, default=50, help="Timeout for stopping a service (seconds)"
 )
-def stop(exclude: str, network_name, remove, timeout):
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Kill containers instead of waiting for them to stop",
+)
+@max_parallel_runs_option
+def stop(exclude: str, network_name, remove, timeout, force, max_parallel_runs: int):
     excluded = exclude.split(",") if exclude else []
     services.stop_services(
-        get_main_directory(), excluded, network_name, remove, timeout
+        get_main_directory(),
+        excluded,
+        network_name,
+        remove,
+        timeout,
+        force=force,
+        max_parallel_runs=max_parallel_runs,
     )
 
 
@@ -62,8 +92,16 @@ def stop(exclude: str, network_name, remove, timeout):
     "--timeout", type=int, default=50, help="Timeout for stopping a service (seconds)"
 )
 @click.option("--remove", is_flag=True, default=False, help="Remove stopped container")
+@max_parallel_runs_option
 @click.argument("service")
-def reload(service: str, network_name: str, timeout: int, remove: bool):
+def reload(
+    service: str, network_name: str, timeout: int, remove: bool, max_parallel_runs: int
+):
     services.reload_service(
-        get_main_directory(), service, network_name, remove, timeout
+        get_main_directory(),
+        service,
+        network_name,
+        remove,
+        timeout,
+        max_parallel_runs=max_parallel_runs,
     )
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING
 
+from miniboss.docker_client import DockerClient
 from miniboss.service_agent import Options, ServiceAgent
 
 if TYPE_CHECKING:
@@ -16,9 +19,25 @@ class RunningContext:
             service: ServiceAgent(service, options, self)
             for name, service in services_by_name.items()
         }
+        # Agents to notify when a service starts or fails (its dependants) or
+        # stops (its dependencies), so that not every waiting agent is visited
+        self._notify_on_start: dict[Service, list[ServiceAgent]] = {}
+        self._notify_on_stop: dict[Service, list[ServiceAgent]] = {}
+        for service, agent in self.agent_set.items():
+            for dependency in service.dependencies:
+                self._notify_on_start.setdefault(dependency, []).append(agent)
+            for dependant in service._dependants:
+                self._notify_on_stop.setdefault(dependant, []).append(agent)
         self.failed_services: list[Service] = []
         self.processed_services: list[Service] = []
         self.service_pop_lock = threading.Lock()
+        # Agents spend most of their time waiting for pings and hooks, so each
+        # one gets a worker; the Docker requests are limited by the run
+        # semaphore of the client instead
+        self.executor = ThreadPoolExecutor(max_workers=max(len(services_by_name), 1))
+        # Listing the containers once is cheaper than a query per service
+        client = DockerClient.get_client()
+        self._existing_by_prefix = client.containers_on_network(options.network)
 
     @property
     def done(self) -> bool:
@@ -36,25 +55,43 @@ class RunningContext:
     def ready_to_stop(self) -> list[ServiceAgent]:
         return [x for x in self.agent_set.values() if x.can_stop]
 
+    def existing_containers(self, name_prefix: str) -> list:
+        return self._existing_by_prefix.get(name_prefix, [])
+
+    def has_running_container(self, name_prefix: str) -> bool:
+        return any(
+            container.status == "running"
+            for container in self.existing_containers(name_prefix)
+        )
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
     def service_failed(self, failed_service: Service) -> None:
+        # The services depending on the failed one, directly or not, cannot be
+        # started either, so they are failed in the same go
         with self.service_pop_lock:
-            self.agent_set.pop(failed_service)
-            self.failed_services.append(failed_service)
-        services_left = list(self.agent_set.keys())
-        for service in services_left:
-            if failed_service in service.dependencies:
-                self.service_failed(service)
+            to_fail = deque([failed_service])
+            while to_fail:
+                service = to_fail.popleft()
+                if self.agent_set.pop(service, None) is None:
+                    # Already failed through another dependency
+                    continue
+                self.failed_services.append(service)
+                to_fail.extend(
+                    agent.service for agent in self._notify_on_start.get(service, [])
+                )
 
     def service_started(self, started_service: Service) -> None:
         with self.service_pop_lock:
             self.agent_set.pop(started_service)
             self.processed_services.append(started_service)
-            for agent in self.agent_set.values():
+            for agent in self._notify_on_start.get(started_service, []):
                 agent.process_service_started(started_service)
 
     def service_stopped(self, stopped_service: Service) -> None:
         with self.service_pop_lock:
             self.agent_set.pop(stopped_service)
             self.processed_services.append(stopped_service)
-            for agent in self.agent_set.values():
+            for agent in self._notify_on_stop.get(stopped_service, []):
                 agent.process_service_stopped(stopped_service)
@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import logging
 import os
-import threading
 import time
+from concurrent.futures import Future
 from datetime import datetime
 from typing import TYPE_CHECKING
 
+import docker.errors  # type: ignore
+
 from miniboss import types
 from miniboss.context import Context
 from miniboss.docker_client import DockerClient
@@ -19,6 +21,9 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+PING_INITIAL_INTERVAL = 0.01
+PING_MAX_INTERVAL = 0.5
+
 
 def container_env(container):
     env = container.attrs["Config"]["Env"]
@@ -38,14 +43,13 @@ def differing_keys(specified, existing):
     return [key for key, value in specified.items() if str(value) != existing.get(key)]
 
 
-class ServiceAgent(threading.Thread):
+class ServiceAgent:
     def __init__(self, service: Service, options: Options, context: RunningContext):
-        super().__init__()
         self.service = service
         self.options = options
         self.context = context
-        self.open_dependencies = service.dependencies[:]
-        self.open_dependants = service._dependants[:]
+        self.open_dependencies = set(service.dependencies)
+        self.open_dependants = set(service._dependants)
         self.run_condition = RunCondition()
         self.status = AgentStatus.NULL
         self._action = None
@@ -65,23 +69,21 @@ class ServiceAgent(threading.Thread):
 
     @property
     def can_start(self):
-        return self.open_dependencies == [] and self.status == AgentStatus.NULL
+        return not self.open_dependencies and self.status == AgentStatus.NULL
 
     @property
     def can_stop(self):
-        return self.open_dependants == [] and self.status == AgentStatus.NULL
+        return not self.open_dependants and self.status == AgentStatus.NULL
 
     @property
     def container_name_prefix(self):
         return f"{self.service.name:s}-{types.group_name:s}"
 
     def process_service_started(self, service):
-        if service in self.open_dependencies:
-            self.open_dependencies.remove(service)
+        self.open_dependencies.discard(service)
 
     def process_service_stopped(self, service):
-        if service in self.open_dependants:
-            self.open_dependants.remove(service)
+        self.open_dependants.discard(service)
 
     def build_image(self):
         client = DockerClient.get_client()
@@ -112,6 +114,9 @@ class ServiceAgent(threading.Thread):
             return
         client = DockerClient.get_client()
         if existing.status == "exited":
+            if self.service.always_start_new:
+                # No need to compare the existing container to the service
+                return
             existing_env = container_env(existing)
             diff_keys = differing_keys(self.service.env, existing_env)
             if diff_keys:
@@ -120,11 +125,7 @@ class ServiceAgent(threading.Thread):
                     self.service.name,
                     ",".join(diff_keys),
                 )
-            start_new = (
-                self.service.always_start_new
-                or self.service.image not in existing.image.tags
-                or bool(diff_keys)
-            )
+            start_new = self.service.image not in existing.image.tags or bool(diff_keys)
             if not start_new:
                 logger.info(
                     "There is an existing container for %s, not creating a new one",
@@ -143,9 +144,7 @@ class ServiceAgent(threading.Thread):
         self.service.env = Context.extrapolate_values(self.service.env)
         # If there are any running with the name prefix, connected to the same
         # network, skip creating
-        existings = client.existing_on_network(
-            self.container_name_prefix, self.options.network
-        )
+        existings = self.context.existing_containers(self.container_name_prefix)
         if existings:
             self._start_existing(existings)
             if self.run_condition.state in [RunCondition.STARTED, RunCondition.RUNNING]:
@@ -170,22 +169,34 @@ class ServiceAgent(threading.Thread):
 
     def ping(self):
         start = time.monotonic()
+        interval = PING_INITIAL_INTERVAL
         while time.monotonic() - start < self.options.timeout:
             if self.service.ping():
                 logger.info("Service %s pinged successfully", self.service.name)
                 self.run_condition.pinged()
                 return True
-            time.sleep(0.1)
-        logger.error("Could not ping service with timeout of %d", self.options.timeout)
+            time.sleep(interval)
+            interval = min(interval * 2, PING_MAX_INTERVAL)
+        logger.error(
+            "Could not ping service %s with timeout of %s",
+            self.service.name,
+            self.options.timeout,
+        )
         return False
 
-    def start_service(self):
+    def _submit(self) -> Future:
+        # The status is set here and not in run so that the agent is not
+        # picked up again while it is waiting for a free worker
+        self.status = AgentStatus.IN_PROGRESS
+        return self.context.executor.submit(self.run)
+
+    def start_service(self) -> Future:
         self.action = Actions.START
-        self.start()
+        return self._submit()
 
-    def stop_service(self):
+    def stop_service(self) -> Future:
         self.action = Actions.STOP
-        self.start()
+        return self._submit()
 
     def run(self):
         if self.action is None:
@@ -203,7 +214,13 @@ class ServiceAgent(threading.Thread):
         self.run_condition.fail()
         self.context.service_failed(self.service)
         if RunCondition.START in self.run_condition.actions:
-            self._stop_container(remove=True)
+            # A new container might have been created in the meantime, so the
+            # containers have to be queried again
+            client = DockerClient.get_client()
+            existings = client.existing_on_network(
+                self.container_name_prefix, self.options.network
+            )
+            self._stop_container(existings, remove=True)
 
     def start_container(self):
         if self.service.name in self.options.build or (
@@ -221,22 +238,31 @@ class ServiceAgent(threading.Thread):
             self.status = AgentStatus.STARTED
             self.context.service_started(self.service)
 
-    def _stop_container(self, remove):
+    def _stop_container(self, existings, remove):
         client = DockerClient.get_client()
-        existings = client.existing_on_network(
-            self.container_name_prefix, self.options.network
-        )
         if not existings:
             logger.info("No containers to stop for %s", self.service.name)
         for existing in existings:
-            if existing.status == "running":
-                existing.stop(timeout=self.options.timeout)
-                logger.info("Stopped container %s", existing.name)
-            if remove:
-                existing.remove()
-                logger.info("Removed container %s", existing.name)
+            with client.run_semaphore:
+                try:
+                    # The container might have exited or been removed since it
+                    # was listed
+                    existing.reload()
+                except docker.errors.NotFound:
+                    logger.info("Container %s is already removed", existing.name)
+                    continue
+                if existing.status == "running" and self.options.force:
+                    existing.kill()
+                    logger.info("Killed container %s", existing.name)
+                elif existing.status == "running":
+                    existing.stop(timeout=self.options.timeout)
+                    logger.info("Stopped container %s", existing.name)
+                if remove:
+                    existing.remove()
+                    logger.info("Removed container %s", existing.name)
 
     def stop_container(self):
-        self._stop_container(remove=self.options.remove)
+        existings = self.context.existing_containers(self.container_name_prefix)
+        self._stop_container(existings, remove=self.options.remove)
         self.status = AgentStatus.STOPPED
         self.context.service_stopped(self.service)
@@ -1,22 +1,23 @@
 from __future__ import annotations
 
 import logging
-import time
-from collections import Counter, deque
+from collections import deque
 from collections.abc import Mapping
-from typing import Any, Callable, Union
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Union
 
 from miniboss import types
 from miniboss.context import Context
 from miniboss.docker_client import DockerClient
 from miniboss.exceptions import ServiceDefinitionError, ServiceLoadError
 from miniboss.running_context import RunningContext
-from miniboss.types import Network, Options
+from miniboss.types import DEFAULT_MAX_PARALLEL_RUNS, AgentStatus, Network, Options
+
+if TYPE_CHECKING:
+    from miniboss.service_agent import ServiceAgent
 
 logger = logging.getLogger(__name__)
 
-KEYCLOAK_PORT = 8090
-OSTKREUZ_PORT = 8080
 ALLOWED_STOP_SIGNALS = ["SIGINT", "SIGTERM", "SIGKILL", "SIGQUIT"]
 
 
@@ -168,13 +169,21 @@ class Service(metaclass=ServiceMeta):
 
 
 def connect_services(services: list[Service]) -> dict[str, Service]:
-    name_counter: Counter[str] = Counter()
+    seen: set[str] = set()
+    # A dict instead of a set, to report the names in the order they appear
+    multiples: dict[str, None] = {}
     for service in services:
-        name_counter[service.name] += 1
-    multiples = [name for name, count in name_counter.items() if count > 1]
+        if service.name in seen:
+            multiples[service.name] = None
+        seen.add(service.name)
     if multiples:
         raise ServiceLoadError(f'Repeated service names: {",".join(multiples)}')
     all_by_name = {service.name: service for service in services}
+    # Dependants are collected while walking the dependencies, instead of
+    # looking for each service in the dependencies of all the others
+    dependants: dict[str, dict[str, Service]] = {
+        service.name: {} for service in services
+    }
     for service in services:
         if isinstance(service, str):
             service = all_by_name[service]
@@ -183,16 +192,85 @@ def connect_services(services: list[Service]) -> dict[str, Service]:
             if isinstance(dependency, str):
                 if dependency not in all_by_name:
                     raise ServiceLoadError(
-                        f"Dependency {service.name:s} of service {dependency:s} not among services"
+                        f"Dependency {dependency:s} of service {service.name:s} not among services"
                     )
                 dependency = all_by_name[dependency]
             actual_deps.append(dependency)
+            if dependency.name in dependants:
+                dependants[dependency.name][service.name] = service
         service.dependencies = actual_deps
     for service in services:
-        service._dependants = [x for x in services if service in x.dependencies]
+        service._dependants = list(dependants[service.name].values())
     return all_by_name
 
 
+def _wait_for_next_agent(
+    running: dict[Future, ServiceAgent], running_context: RunningContext
+) -> dict[Future, ServiceAgent]:
+    """Wait until at least one of the running agents is finished, and return the
+    ones still running. Other agents can become ready only when an agent
+    finishes, so there is no need to poll in between. An agent that finishes
+    with an error did not process its service, which is registered as failed."""
+    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+    for future in finished:
+        agent = running.pop(future)
+        exc = future.exception()
+        if exc is not None:
+            logger.error("Error in service agent", exc_info=exc)
+            agent.status = AgentStatus.FAILED
+            running_context.service_failed(agent.service)
+    return running
+
+
+def _find_cycles(services: Iterable[Service]) -> list[list[Service]]:
+    """Return the groups of services that depend on each other in a cycle, using
+    an iterative version of Tarjan's strongly connected components algorithm."""
+    index: dict[Service, int] = {}
+    lowlink: dict[Service, int] = {}
+    stack: list[Service] = []
+    on_stack: set[Service] = set()
+    cycles = []
+
+    def visit(service):
+        index[service] = lowlink[service] = len(index)
+        stack.append(service)
+        on_stack.add(service)
+
+    def pop_component(service):
+        component = []
+        while True:
+            member = stack.pop()
+            on_stack.discard(member)
+            component.append(member)
+            if member is service:
+                return component
+
+    for root in services:
+        if root in index:
+            continue
+        visit(root)
+        work = [(root, iter(root.dependencies))]
+        while work:
+            service, dependencies = work[-1]
+            for dependency in dependencies:
+                if dependency not in index:
+                    visit(dependency)
+                    work.append((dependency, iter(dependency.dependencies)))
+                    break
+                if dependency in on_stack:
+                    lowlink[service] = min(lowlink[service], index[dependency])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[service])
+                if lowlink[service] == index[service]:
+                    component = pop_component(service)
+                    if len(component) > 1 or service in service.dependencies:
+                        cycles.append(component)
+    return cycles
+
+
 class ServiceCollection:
     def __init__(self):
         self.all_by_name = {}
@@ -209,11 +287,14 @@ class ServiceCollection:
 
     def exclude_for_start(self, exclude):
         self.excluded = exclude
+        # Membership is checked once per dependency of every service; a dict
+        # also drops repeated names while keeping the order they were given in
+        excluded = dict.fromkeys(exclude)
         for service in self.all_by_name.values():
-            if service.name in exclude:
+            if service.name in excluded:
                 continue
             excluded_deps = [
-                dep.name for dep in service.dependencies if dep.name in exclude
+                dep.name for dep in service.dependencies if dep.name in excluded
             ]
             if excluded_deps:
                 msg = f"{excluded_deps[0]} is to be excluded, but {service.name:s} depends on it"
@@ -223,15 +304,16 @@ class ServiceCollection:
             multiple = "s" if len(missing) > 1 else ""
             msg = f"Service{multiple} to be excluded, but not defined: {','.join(missing)}"
             raise ServiceLoadError(msg)
-        for name in exclude:
+        for name in excluded:
             self.all_by_name.pop(name)
 
     def exclude_for_stop(self, exclude):
         self.excluded = exclude
-        for service_name in exclude:
+        excluded = dict.fromkeys(exclude)
+        for service_name in excluded:
             service = self.all_by_name[service_name]
             deps_to_be_stopped = [
-                dep.name for dep in service.dependencies if dep.name not in exclude
+                dep.name for dep in service.dependencies if dep.name not in excluded
             ]
             if deps_to_be_stopped:
                 msg = f"{deps_to_be_stopped[0]} is to be stopped, but {service.name} depends on it"
@@ -239,25 +321,31 @@ class ServiceCollection:
             self.all_by_name.pop(service_name)
 
     def check_circular_dependencies(self):
-        with_dependencies = [
-            x for x in self.all_by_name.values() if x.dependencies != []
-        ]
-        # pylint: disable=cell-var-from-loop
-        for service in with_dependencies:
-            start = service.name
-            count = 0
-
-            def go_up_dependencies(checked):
-                nonlocal count
-                count += 1
-                for dependency in checked.dependencies:
-                    if dependency.name == start:
-                        raise ServiceLoadError("Circular dependency detected")
-                    if count == len(self.all_by_name):
-                        return
-                    go_up_dependencies(dependency)
-
-            go_up_dependencies(service)
+        # Kahn's algorithm: repeatedly remove services without open
+        # dependencies; the ones left over are part of a cycle. A dependency
+        # can be listed more than once, but the dependant is registered once.
+        open_counts = {
+            service: len(set(service.dependencies))
+            for service in self.all_by_name.values()
+        }
+        queue = deque(service for service, count in open_counts.items() if count == 0)
+        resolved = 0
+        while queue:
+            service = queue.popleft()
+            resolved += 1
+            for dependant in service._dependants:
+                open_counts[dependant] -= 1
+                if open_counts[dependant] == 0:
+                    queue.append(dependant)
+        if resolved != len(open_counts):
+            cycles = _find_cycles(self.all_by_name.values())
+            if not cycles:
+                # Should not happen, but the error has to name the services
+                cycles = [[service for service, count in open_counts.items() if count]]
+            names = "; ".join(
+                ", ".join(sorted(service.name for service in cycle)) for cycle in cycles
+            )
+            raise ServiceLoadError(f"Circular dependency detected between: {names}")
 
     def __len__(self):
         return len(self.all_by_name)
@@ -274,13 +362,34 @@ class ServiceCollection:
 
     def start_all(self, options: Options) -> list[str]:
         docker = DockerClient.get_client()
+        docker.limit_parallel_runs(options.max_parallel_runs)
         network = docker.create_network(options.network.name)
         options.network.id = network.id
         self.running_context = RunningContext(self.all_by_name, options)
+        # Images of services with a build directory might be built instead, and
+        # running containers are left alone
+        docker.check_images(
+            agent.service.image
+            for agent in self.running_context.agent_set.values()
+            if not agent.service.build_from
+            and not self.running_context.has_running_container(
+                agent.container_name_prefix
+            )
+        )
+        running: dict[Future, ServiceAgent] = {}
         while not self.running_context.done:
             for agent in self.running_context.ready_to_start:
-                agent.start_service()
-            time.sleep(0.01)
+                running[agent.start_service()] = agent
+            if not running:
+                break
+            running = _wait_for_next_agent(running, self.running_context)
+        self.running_context.shutdown()
+        # Images of services that were not started are not needed any more
+        docker.cancel_image_checks()
+        # Services that are neither started nor failed at this point could not
+        # be started
+        for service in list(self.running_context.agent_set):
+            self.running_context.service_failed(service)
         failed = []
         if self.running_context.failed_services:
             failed = [x.name for x in self.running_context.failed_services]
@@ -289,13 +398,22 @@ class ServiceCollection:
 
     def stop_all(self, options: Options) -> list[str]:
         docker = DockerClient.get_client()
+        docker.limit_parallel_runs(options.max_parallel_runs)
+        # Without a network, there are no containers on it to stop
+        network = docker.get_network(options.network.name)
+        if network is not None:
+            options.network.id = network.id
         self.running_context = RunningContext(self.all_by_name, options)
         stopped = []
+        running: dict[Future, ServiceAgent] = {}
         while not (self.running_context.done or self.running_context.failed_services):
             for agent in self.running_context.ready_to_stop:
-                agent.stop_service()
+                running[agent.stop_service()] = agent
                 stopped.append(agent.service.name)
-            time.sleep(0.01)
+            if not running:
+                break
+            running = _wait_for_next_agent(running, self.running_context)
+        self.running_context.shutdown()
         if options.remove and not self.excluded:
             docker.remove_network(options.network.name)
         return stopped
@@ -303,14 +421,15 @@ class ServiceCollection:
     def update_for_base_service(self, service_name):
         if service_name not in self.all_by_name:
             raise ServiceLoadError(f"No such service: {service_name}")
-        queue = deque()
-        queue.append(self.all_by_name[service_name])
+        queue = deque([self.all_by_name[service_name]])
+        visited = {service_name}
         required = []
         while queue:
             service = queue.popleft()
             required.append(service)
             for dependant in service._dependants:
-                if dependant not in queue and dependant not in required:
+                if dependant.name not in visited:
+                    visited.add(dependant.name)
                     queue.append(dependant)
         self.all_by_name = {service.name: service for service in required}
 
@@ -332,7 +451,13 @@ def on_start_services(hook_func: ServicesHookType):
     _start_services_hook = hook_func
 
 
-def start_services(maindir: str, exclude: list[str], network_name: str, timeout: int):
+def start_services(
+    maindir: str,
+    exclude: list[str],
+    network_name: str,
+    timeout: int,
+    max_parallel_runs: int = DEFAULT_MAX_PARALLEL_RUNS,
+):
     types.update_group_name(maindir)
     Context.load_from(maindir)
     collection = ServiceCollection()
@@ -345,6 +470,7 @@ def start_services(maindir: str, exclude: list[str], network_name: str, timeout:
         remove=False,
         run_dir=maindir,
         build=[],
+        max_parallel_runs=max_parallel_runs,
     )
     service_names = collection.start_all(options)
     logger.info("Started services: %s", ", ".join(service_names))
@@ -366,8 +492,15 @@ def on_stop_services(hook_func: ServicesHookType):
     _stop_services_hook = hook_func
 
 
+# pylint: disable=too-many-arguments
 def stop_services(
-    maindir: str, excluded: list[str], network_name: str, remove: bool, timeout: int
+    maindir: str,
+    excluded: list[str],
+    network_name: str,
+    remove: bool,
+    timeout: int,
+    force: bool = False,
+    max_parallel_runs: int = DEFAULT_MAX_PARALLEL_RUNS,
 ):
     types.update_group_name(maindir)
     logger.info(
@@ -381,6 +514,8 @@ def stop_services(
         remove=remove,
         run_dir=maindir,
         build=[],
+        force=force,
+        max_parallel_runs=max_parallel_runs,
     )
     collection = ServiceCollection()
     collection.load_definitions()
@@ -407,7 +542,12 @@ def on_reload_service(hook_func: SingleServiceHookType):
 
 # pylint: disable=too-many-arguments
 def reload_service(
-    maindir: str, service: str, network_name: str, remove: bool, timeout: int
+    maindir: str,
+    service: str,
+    network_name: str,
+    remove: bool,
+    timeout: int,
+    max_parallel_runs: int = DEFAULT_MAX_PARALLEL_RUNS,
 ):
     types.update_group_name(maindir)
     network_name = network_name or f"miniboss-{types.group_name}"
@@ -417,6 +557,7 @@ def reload_service(
         remove=remove,
         run_dir=maindir,
         build=[service],
+        max_parallel_runs=max_parallel_runs,
     )
     stop_collection = ServiceCollection()
     stop_collection.load_definitions()
@@ -433,7 +574,7 @@ def reload_service(
     try:
         _reload_service_hook(service)
     except KeyboardInterrupt:
-        logger.info("Interrupted on_stop_services hook")
+        logger.info("Interrupted on_reload_service hook")
         return
     except:  # pylint: disable=bare-except
-        logger.exception("Error running on_stop_services hook")
+        logger.exception("Error running on_reload_service hook")
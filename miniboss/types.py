@@ -7,14 +7,26 @@ from slugify import slugify
 
 from miniboss.exceptions import MinibossException
 
+# Docker daemons tend to time out when too many containers are created and
+# started at the same time; this is the default cap on such operations, which can
+# be changed with the --max-parallel-runs option. The connection pool of the
+# Docker client is sized according to the cap.
+DEFAULT_MAX_PARALLEL_RUNS = 10
 
-@attr.s(kw_only=True)
+
+@attr.s(kw_only=True, slots=True)
 class Network:
     name: str = attr.ib(validator=instance_of(str))
     id: str = attr.ib(validator=instance_of(str))
 
 
-@attr.s(kw_only=True)
+def _at_least_one(_instance, attribute, value):
+    # attrs.validators.ge is not available in the supported attrs versions
+    if value < 1:
+        raise ValueError(f"'{attribute.name}' has to be at least 1, not {value}")
+
+
+@attr.s(kw_only=True, slots=True)
 class Options:
     network: Network = attr.ib(validator=instance_of(Network))
     timeout: Union[float, int] = attr.ib(validator=instance_of((float, int)))
@@ -23,6 +35,10 @@ class Options:
     build: Iterable[str] = attr.ib(
         validator=deep_iterable(member_validator=instance_of(str))
     )
+    force: bool = attr.ib(default=False, validator=instance_of(bool))
+    max_parallel_runs: int = attr.ib(
+        default=DEFAULT_MAX_PARALLEL_RUNS, validator=[instance_of(int), _at_least_one]
+    )
 
 
 class AgentStatus:
@@ -14,7 +14,7 @@ setup(
     long_description_content_type="text/markdown",
     install_requires=[
         "click>7",
-        "docker>4",
+        "docker>=4.3",
         "furl>2",
         "requests>2",
         "attrs>20",
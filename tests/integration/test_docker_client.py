@@ -11,7 +11,7 @@ import requests
 
 import miniboss
 from miniboss import exceptions
-from miniboss.docker_client import DockerClient
+from miniboss.docker_client import CLIENT_TIMEOUT, DockerClient
 from miniboss.types import Network
 
 _lib_client = None
@@ -63,6 +63,10 @@ class DockerClientTests(unittest.TestCase):
         for image_name in self.image_cleanup:
             network = lib_client.images.remove(image_name)
 
+    def test_client_timeout(self):
+        client = DockerClient.get_client()
+        assert client.lib_client.api.timeout == CLIENT_TIMEOUT
+
     def test_create_remove_network(self):
         client = DockerClient.get_client()
         client.create_network("miniboss-test-network")
@@ -73,6 +77,23 @@ class DockerClientTests(unittest.TestCase):
         networks = lib_client.networks.list()
         assert "miniboss-test-network" not in [n.name for n in networks]
 
+    def test_create_network_existing(self):
+        client = DockerClient.get_client()
+        network = client.create_network("miniboss-test-network")
+        self.network_cleanup.append("miniboss-test-network")
+        again = client.create_network("miniboss-test-network")
+        assert again.id == network.id
+
+    def test_remove_network_missing(self):
+        client = DockerClient.get_client()
+        # Should not raise an error
+        client.remove_network("miniboss-test-network-not-existing")
+
+    def test_containers_on_network_without_id(self):
+        client = DockerClient.get_client()
+        # Should not list the containers on all networks
+        assert client.containers_on_network(Network(name="bridge", id="")) == {}
+
     def test_run_service_on_network(self):
         client = DockerClient.get_client()
         client.create_network("miniboss-test-network")
@@ -99,6 +120,22 @@ class DockerClientTests(unittest.TestCase):
         assert len(network.containers) == 1
         assert network.containers[0].name == container_name
 
+    def test_run_service_missing_image(self):
+        client = DockerClient.get_client()
+        client.create_network("miniboss-test-network")
+        self.network_cleanup.append("miniboss-test-network")
+
+        class TestService(miniboss.Service):
+            name = "test-service"
+            image = "somerepothatdoesntexist.org/imagename:imagetag"
+
+        with pytest.raises(exceptions.DockerException):
+            client.run_service_on_network(
+                "miniboss-test-service",
+                TestService(),
+                Network(name="miniboss-test-network", id=""),
+            )
+
     def test_service_entrypoint(self):
         client = DockerClient.get_client()
         client.create_network("miniboss-test-network")
@@ -258,6 +295,11 @@ app.run(host='0.0.0.0', port=8080)
         with pytest.raises(exceptions.DockerException):
             client.check_image("somerepothatdoesntexist.org/imagename:imagetag")
 
+    def test_check_images_invalid_url(self):
+        client = DockerClient.get_client()
+        # Errors are left to be reported when the service is started
+        client.check_images(["somerepothatdoesntexist.org/imagename:imagetag"])
+
     def test_check_image_missing_tag(self):
         lib_client = get_lib_client()
         lib_client.images.pull("registry:2")
@@ -1,7 +1,11 @@
+import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from types import SimpleNamespace as Bunch
 
+import docker.errors
+
 from miniboss.types import Network, Options
 
 DEFAULT_OPTIONS = Options(
@@ -18,6 +22,12 @@ class FakeRunningContext:
         self.started_services = []
         self.stopped_services = []
         self.failed_services = []
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def existing_containers(self, name_prefix):
+        return FakeDocker.Instance.existing_on_network(
+            name_prefix, DEFAULT_OPTIONS.network
+        )
 
     def service_started(self, service):
         self.started_services.append(service)
@@ -76,6 +86,7 @@ class FakeService:
 class FakeContainer(Bunch):
     def __init__(self, **kwargs):
         self.stopped = False
+        self.killed = False
         self.removed_at = None
         self.timeout = None
         super().__init__(**kwargs)
@@ -85,6 +96,14 @@ class FakeContainer(Bunch):
         self.removed_at = None
         self.timeout = timeout
 
+    def reload(self):
+        if getattr(self, "removed_externally", False):
+            raise docker.errors.NotFound("No such container")
+        self.status = getattr(self, "status_on_reload", self.status)
+
+    def kill(self):
+        self.killed = True
+
     def remove(self):
         time.sleep(0.1)
         self.removed_at = time.time()
@@ -102,15 +121,35 @@ class FakeDocker:
         self._networks_removed = []
         self._services_started = []
         self._existing_queried = []
+        self._networks_listed = []
         self._containers_ran = []
         self._images_built = []
         self._existing_containers = []
+        self._parallel_run_limits = []
+        self._images_checked = []
+        self._image_checks_cancelled = False
         self.network_name_id_mapping = network_name_id_mapping or {}
+        self.run_semaphore = threading.BoundedSemaphore(10)
+
+    def limit_parallel_runs(self, limit):
+        self._parallel_run_limits.append(limit)
+        self.run_semaphore = threading.BoundedSemaphore(limit)
 
     def create_network(self, network_name):
         self._networks_created.append(network_name)
         return Bunch(id=self.network_name_id_mapping[network_name])
 
+    def get_network(self, network_name):
+        if network_name not in self.network_name_id_mapping:
+            return None
+        return Bunch(id=self.network_name_id_mapping[network_name])
+
+    def check_images(self, tags):
+        self._images_checked.append(set(tags))
+
+    def cancel_image_checks(self):
+        self._image_checks_cancelled = True
+
     def remove_network(self, network_name):
         self._networks_removed.append(network_name)
 
@@ -124,6 +163,17 @@ class FakeDocker:
                 return [container]
         return []
 
+    def containers_on_network(self, network):
+        self._networks_listed.append(network)
+        by_prefix = {}
+        if not network.id:
+            return by_prefix
+        for container in self._existing_containers:
+            if self.network_name_id_mapping[container.network] == network.id:
+                name_prefix = container.name.rsplit("-", 1)[0]
+                by_prefix.setdefault(name_prefix, []).append(container)
+        return by_prefix
+
     def run_service_on_network(self, name_prefix, service, network):
         self._services_started.append((name_prefix, service, network))
 
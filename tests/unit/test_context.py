@@ -18,6 +18,11 @@ class ContextTests(unittest.TestCase):
         context = _Context(blah=123, yada="hello")
         assert 20 == context.extrapolate(20)
 
+    def test_extrapolate_no_fields(self):
+        context = _Context(blah=123, yada="hello")
+        assert context.extrapolate("Say nothing") == "Say nothing"
+        assert context.extrapolate("Say {{braces}}") == "Say {braces}"
+
     def test_extrapolate_key_missing(self):
         context = _Context(blah=123, yada="hello")
         with pytest.raises(ContextError):
@@ -25,8 +30,9 @@ class ContextTests(unittest.TestCase):
 
     def test_extrapolate_index_error(self):
         context = _Context(blah=123, yada="hello")
-        with pytest.raises(ContextError):
+        with pytest.raises(ContextError) as exc_info:
             context.extrapolate("Say {} to {blah}")
+        assert "'Say {} to {blah}'" in str(exc_info.value)
 
     def test_extrapolate_type_mismatch(self):
         context = _Context(blah=123, yada="hello")
@@ -0,0 +1,264 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace as Bunch
+from unittest.mock import MagicMock, patch
+
+import docker.errors
+import pytest
+
+from miniboss import docker_client
+from miniboss.docker_client import DockerClient
+from miniboss.exceptions import ContainerStartException, DockerException
+from miniboss.services import Service
+from miniboss.types import Network
+
+
+class GetClientTests(unittest.TestCase):
+    def setUp(self):
+        docker_client._the_docker = None
+
+    def tearDown(self):
+        docker_client._the_docker = None
+
+    @patch("miniboss.docker_client.docker")
+    def test_single_client_across_threads(self, mock_docker):
+        clients = []
+        threads = [
+            threading.Thread(target=lambda: clients.append(DockerClient.get_client()))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert mock_docker.from_env.call_count == 1
+        assert all(client is clients[0] for client in clients)
+
+    @patch("miniboss.docker_client.docker")
+    def test_limit_parallel_runs_pool_size(self, mock_docker):
+        client = DockerClient.get_client()
+        mock_docker.from_env.assert_called_once_with(
+            max_pool_size=20, timeout=docker_client.CLIENT_TIMEOUT
+        )
+        client.limit_parallel_runs(5)
+        assert mock_docker.from_env.call_count == 1
+        client.limit_parallel_runs(15)
+        assert mock_docker.from_env.call_count == 2
+        mock_docker.from_env.assert_called_with(
+            max_pool_size=30, timeout=docker_client.CLIENT_TIMEOUT
+        )
+        assert client.run_semaphore._value == 15
+
+    def test_limit_parallel_runs_at_least_one(self):
+        client = DockerClient(MagicMock())
+        with pytest.raises(DockerException):
+            client.limit_parallel_runs(0)
+
+
+class RunContainerTests(unittest.TestCase):
+    def setUp(self):
+        self.lib_client = MagicMock()
+        self.lib_client.api.inspect_container.return_value = {
+            "Name": "/the-container",
+            "State": {"Status": "running"},
+        }
+        self.lib_client.api.logs.return_value = b"Going down\n"
+        self.client = DockerClient(self.lib_client)
+
+    def test_return_when_running(self):
+        start = time.monotonic()
+        self.client.run_container("the-id")
+        assert time.monotonic() - start < docker_client.START_SETTLE_TIME
+        self.lib_client.api.start.assert_called_once_with("the-id")
+        assert self.lib_client.api.inspect_container.call_count > 1
+
+    def test_raise_when_exited(self):
+        self.lib_client.api.inspect_container.side_effect = [
+            {"Name": "/the-container", "State": {"Status": "running"}},
+            {"Name": "/the-container", "State": {"Status": "exited"}},
+        ]
+        with pytest.raises(ContainerStartException) as exception_context:
+            self.client.run_container("the-id")
+        assert exception_context.value.container_name == "the-container"
+        assert exception_context.value.logs == "Going down\n"
+
+    def test_raise_on_start_error(self):
+        self.lib_client.api.start.side_effect = docker.errors.APIError(
+            "Failed", explanation="cgroups"
+        )
+        with pytest.raises(DockerException):
+            self.client.run_container("the-id")
+        self.lib_client.api.inspect_container.assert_not_called()
+
+    def test_release_semaphore_while_watching(self):
+        """Only the start request is limited by the parallel runs"""
+        self.client.limit_parallel_runs(1)
+        available = []
+
+        def start(_):
+            assert not self.client.run_semaphore.acquire(blocking=False)
+
+        self.lib_client.api.start.side_effect = start
+
+        def inspect(_):
+            acquired = self.client.run_semaphore.acquire(blocking=False)
+            available.append(acquired)
+            if acquired:
+                self.client.run_semaphore.release()
+            return {"Name": "/the-container", "State": {"Status": "running"}}
+
+        self.lib_client.api.inspect_container.side_effect = inspect
+        self.client.run_container("the-id")
+        assert available and all(available)
+
+
+class CheckImagesTests(unittest.TestCase):
+    def setUp(self):
+        self.lib_client = MagicMock()
+        self.lib_client.api.inspect_container.return_value = {
+            "Name": "/the-container",
+            "State": {"Status": "running"},
+        }
+        self.client = DockerClient(self.lib_client)
+        self.events = []
+
+    def test_check_images_in_background(self):
+        release = threading.Event()
+
+        def get_image(tag):
+            release.wait(5)
+            self.events.append(f"checked {tag}")
+
+        self.lib_client.images.get.side_effect = get_image
+        self.client.check_images(["the/image"])
+        self.events.append("returned")
+        release.set()
+        self.client._wait_for_image_check("the/image")
+        assert self.events == ["returned", "checked the/image"]
+
+    def test_run_service_waits_for_own_image(self):
+        def get_image(tag):
+            if tag == "other/image":
+                time.sleep(0.5)
+            else:
+                time.sleep(0.1)
+            self.events.append(f"checked {tag}")
+
+        def create_container(image, **_):
+            self.events.append(f"created {image}")
+            return {"Id": "the-id"}
+
+        self.lib_client.images.get.side_effect = get_image
+        self.lib_client.api.create_container.side_effect = create_container
+
+        class ImageService(Service):
+            name = "image-service"
+            image = "the/image"
+
+        self.client.check_images(["the/image", "other/image"])
+        self.client.run_service_on_network(
+            "image-service-testing", ImageService(), Network(name="the-network", id="")
+        )
+        assert self.events == ["checked the/image", "created the/image"]
+
+    def test_pull_on_create_outside_semaphore(self):
+        self.client.limit_parallel_runs(1)
+        self.lib_client.images.get.side_effect = docker.errors.ImageNotFound("No")
+
+        def pull_image(tag):
+            assert self.client.run_semaphore.acquire(blocking=False)
+            self.client.run_semaphore.release()
+            self.events.append(f"pulled {tag}")
+
+        self.lib_client.images.pull.side_effect = pull_image
+        self.lib_client.api.create_container.side_effect = [
+            docker.errors.ImageNotFound("No"),
+            {"Id": "the-id"},
+        ]
+
+        class PulledService(Service):
+            name = "pulled-service"
+            image = "the/image"
+
+        self.client.run_service_on_network(
+            "pulled-service-testing",
+            PulledService(),
+            Network(name="the-network", id=""),
+        )
+        assert self.events == ["pulled the/image"]
+        assert self.lib_client.api.create_container.call_count == 2
+
+    def test_failed_check_not_repeated(self):
+        self.lib_client.images.get.side_effect = docker.errors.ImageNotFound("No")
+        self.lib_client.images.pull.side_effect = docker.errors.APIError(
+            "Failed", explanation="no such host"
+        )
+
+        class FailingService(Service):
+            name = "failing-image-service"
+            image = "the/image"
+
+        self.client.check_images(["the/image"])
+        with pytest.raises(DockerException):
+            self.client.run_service_on_network(
+                "failing-image-service-testing",
+                FailingService(),
+                Network(name="the-network", id=""),
+            )
+        assert self.lib_client.images.pull.call_count == 1
+        self.lib_client.api.create_container.assert_not_called()
+
+    def test_cancel_image_checks(self):
+        self.client.limit_parallel_runs(1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def get_image(tag):
+            started.set()
+            release.wait(5)
+            self.events.append(f"checked {tag}")
+
+        self.lib_client.images.get.side_effect = get_image
+        self.client.check_images(["the/image", "other/image"])
+        checks = list(self.client._image_checks.values())
+        started.wait(5)
+        self.client.cancel_image_checks()
+        release.set()
+        # Only one worker, so one of the checks was still waiting to run
+        assert [check.cancelled() for check in checks].count(True) == 1
+        for check in checks:
+            if not check.cancelled():
+                check.result()
+        assert len(self.events) == 1
+        assert self.client._image_checks == {}
+
+
+class NetworkTests(unittest.TestCase):
+    def setUp(self):
+        self.lib_client = MagicMock()
+        self.client = DockerClient(self.lib_client)
+
+    def test_get_network_ambiguous_name(self):
+        self.lib_client.networks.get.side_effect = docker.errors.APIError(
+            "network the-network is ambiguous (2 matches found on name)"
+        )
+        network = Bunch(name="the-network", id="the-network-id")
+        self.lib_client.networks.list.return_value = [
+            Bunch(name="the-network-2", id="other-network-id"),
+            network,
+        ]
+        assert self.client.create_network("the-network") is network
+        self.lib_client.networks.list.assert_called_once_with(names=["the-network"])
+        self.lib_client.networks.create.assert_not_called()
+
+    def test_get_network_id_prefix(self):
+        self.lib_client.networks.get.return_value = Bunch(name="bridge", id="abc123def")
+        self.lib_client.networks.list.return_value = []
+        assert self.client.get_network("abc123") is None
+        self.lib_client.networks.list.assert_called_once_with(names=["abc123"])
+
+    def test_get_network_missing(self):
+        self.lib_client.networks.get.side_effect = docker.errors.NotFound("Not found")
+        assert self.client.get_network("the-network") is None
+        self.lib_client.networks.list.assert_not_called()
@@ -57,6 +57,15 @@ class MainTests(TestCase):
         args = mock_services.stop_services.mock_calls[0][1]
         assert args[1:] == (["testy"], "yada", True, 10)
 
+    @mock.patch("miniboss.main.services")
+    def test_stop_force(self, mock_services):
+        runner = CliRunner()
+        result = runner.invoke(main.stop, ["--force"])
+        assert result.exit_code == 0
+        assert mock_services.stop_services.call_count == 1
+        kwargs = mock_services.stop_services.mock_calls[0][2]
+        assert kwargs == {"force": True, "max_parallel_runs": 10}
+
     @mock.patch("miniboss.main.services")
     def test_reload(self, mock_services):
         runner = CliRunner()
@@ -75,3 +84,23 @@ class MainTests(TestCase):
         assert mock_services.reload_service.call_count == 1
         args = mock_services.reload_service.mock_calls[0][1]
         assert args[1:] == ("testy", "yada", True, 10)
+
+    @mock.patch("miniboss.main.services")
+    def test_max_parallel_runs(self, mock_services):
+        runner = CliRunner()
+        runner.invoke(main.start, ["--max-parallel-runs", "3"])
+        kwargs = mock_services.start_services.mock_calls[0][2]
+        assert kwargs == {"max_parallel_runs": 3}
+        runner.invoke(main.stop, ["--max-parallel-runs", "4"])
+        kwargs = mock_services.stop_services.mock_calls[0][2]
+        assert kwargs == {"force": False, "max_parallel_runs": 4}
+        runner.invoke(main.reload, ["testy", "--max-parallel-runs", "5"])
+        kwargs = mock_services.reload_service.mock_calls[0][2]
+        assert kwargs == {"max_parallel_runs": 5}
+
+    @mock.patch("miniboss.main.services")
+    def test_max_parallel_runs_positive(self, mock_services):
+        runner = CliRunner()
+        result = runner.invoke(main.start, ["--max-parallel-runs", "0"])
+        assert result.exit_code != 0
+        assert mock_services.start_services.call_count == 0
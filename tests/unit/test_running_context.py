@@ -2,14 +2,22 @@ import unittest
 from types import SimpleNamespace as Bunch
 from unittest.mock import patch
 
-from common import DEFAULT_OPTIONS, FakeService
+import attr
+from common import DEFAULT_OPTIONS, FakeContainer, FakeDocker, FakeService
 
+from miniboss import running_context
 from miniboss.running_context import RunningContext
 from miniboss.service_agent import Options
 from miniboss.services import connect_services
 
 
 class RunningContextTests(unittest.TestCase):
+    def setUp(self):
+        self.docker = FakeDocker.Instance = FakeDocker(
+            {"the-network": "the-network-id"}
+        )
+        running_context.DockerClient = self.docker
+
     def test_service_started(self):
         services = connect_services(
             [
@@ -26,6 +34,20 @@ class RunningContextTests(unittest.TestCase):
         assert services["service2"] in context.agent_set
         assert context.agent_set[services["service2"]].can_start
 
+    def test_service_started_multiple_dependencies(self):
+        services = connect_services(
+            [
+                FakeService(name="service1", dependencies=[]),
+                FakeService(name="service2", dependencies=[]),
+                FakeService(name="service3", dependencies=["service1", "service2"]),
+            ]
+        )
+        context = RunningContext(services, DEFAULT_OPTIONS)
+        context.service_started(services["service1"])
+        assert not context.agent_set[services["service3"]].can_start
+        context.service_started(services["service2"])
+        assert context.agent_set[services["service3"]].can_start
+
     def test_ready_to_start_and_stop(self):
         services = connect_services(
             [
@@ -104,6 +126,26 @@ class RunningContextTests(unittest.TestCase):
         context.service_failed(services["service1"])
         assert len(context.failed_services) == 2
 
+    def test_fail_dependencies_diamond(self):
+        services = connect_services(
+            [
+                FakeService(name="service1", dependencies=[]),
+                FakeService(name="service2", dependencies=["service1"]),
+                FakeService(name="service3", dependencies=["service1"]),
+                FakeService(name="service4", dependencies=["service2", "service3"]),
+                FakeService(name="service5", dependencies=[]),
+            ]
+        )
+        context = RunningContext(services, DEFAULT_OPTIONS)
+        context.service_failed(services["service1"])
+        assert [x.name for x in context.failed_services] == [
+            "service1",
+            "service2",
+            "service3",
+            "service4",
+        ]
+        assert list(context.agent_set.keys()) == [services["service5"]]
+
     @patch("miniboss.running_context.threading")
     def test_service_started_lock_call(self, mock_threading):
         services = connect_services(
@@ -128,6 +170,48 @@ class RunningContextTests(unittest.TestCase):
         context = RunningContext(services, DEFAULT_OPTIONS)
         context.service_failed(services["service1"])
         mock_lock = mock_threading.Lock.return_value
-        # This has to be 2 because service1 has a dependency, and it has to be
-        # locked as well
-        assert mock_lock.__enter__.call_count == 2
+        # The dependant of service1 is failed while holding the same lock
+        assert mock_lock.__enter__.call_count == 1
+
+    def test_worker_per_service(self):
+        """Agents waiting on pings should not hold back the others, so the number
+        of workers is not limited by the parallel runs"""
+        services = connect_services(
+            [
+                FakeService(name="service1", dependencies=[]),
+                FakeService(name="service2", dependencies=[]),
+                FakeService(name="service3", dependencies=[]),
+            ]
+        )
+        options = attr.evolve(DEFAULT_OPTIONS, max_parallel_runs=1)
+        context = RunningContext(services, options)
+        assert context.executor._max_workers == 3
+        context.shutdown()
+
+    def test_existing_containers(self):
+        container1 = FakeContainer(
+            name="service1-testing-1234", network="the-network", status="running"
+        )
+        container2 = FakeContainer(
+            name="service1-testing-5678", network="the-network", status="exited"
+        )
+        container3 = FakeContainer(
+            name="service2-testing-5678", network="the-network", status="running"
+        )
+        self.docker._existing_containers = [container1, container2, container3]
+        services = connect_services(
+            [
+                FakeService(name="service1", dependencies=[]),
+                FakeService(name="service2", dependencies=["service1"]),
+            ]
+        )
+        context = RunningContext(services, DEFAULT_OPTIONS)
+        assert context.existing_containers("service1-testing") == [
+            container1,
+            container2,
+        ]
+        assert context.existing_containers("service2-testing") == [container3]
+        assert context.existing_containers("service3-testing") == []
+        # The containers should be listed only once
+        assert self.docker._networks_listed == [DEFAULT_OPTIONS.network]
+        assert self.docker._existing_queried == []
@@ -38,8 +38,8 @@ class ServiceAgentTests(unittest.TestCase):
     def test_can_start(self):
         services = connect_services(
             [
-                Bunch(name="service1", dependencies=[]),
-                Bunch(name="service2", dependencies=["service1"]),
+                FakeService(name="service1", dependencies=[]),
+                FakeService(name="service2", dependencies=["service1"]),
             ]
         )
         agent = ServiceAgent(services["service2"], DEFAULT_OPTIONS, None)
@@ -52,8 +52,8 @@ class ServiceAgentTests(unittest.TestCase):
     def test_can_stop(self):
         services = connect_services(
             [
-                Bunch(name="service1", dependencies=[]),
-                Bunch(name="service2", dependencies=["service1"]),
+                FakeService(name="service1", dependencies=[]),
+                FakeService(name="service2", dependencies=["service1"]),
             ]
         )
         agent = ServiceAgent(services["service1"], DEFAULT_OPTIONS, None)
@@ -63,7 +63,7 @@ class ServiceAgentTests(unittest.TestCase):
 
     def test_action_property(self):
         service = Bunch(name="service1", dependencies=[], _dependants=[])
-        agent = ServiceAgent(service, DEFAULT_OPTIONS, None)
+        agent = ServiceAgent(service, DEFAULT_OPTIONS, FakeRunningContext())
         assert agent.action is None
         with pytest.raises(ServiceAgentException):
             agent.action = "blah"
@@ -80,7 +80,7 @@ class ServiceAgentTests(unittest.TestCase):
         assert fake_context.failed_services[0] is service
 
     def test_run_image(self):
-        agent = ServiceAgent(FakeService(), DEFAULT_OPTIONS, None)
+        agent = ServiceAgent(FakeService(), DEFAULT_OPTIONS, FakeRunningContext())
         agent.run_image()
         assert len(self.docker._services_started) == 1
         prefix, service, network = self.docker._services_started[0]
@@ -94,7 +94,7 @@ class ServiceAgentTests(unittest.TestCase):
         service.env = {"ENV_ONE": "http://{host}:{port:d}"}
         context.Context["host"] = "zombo.com"
         context.Context["port"] = 80
-        agent = ServiceAgent(service, DEFAULT_OPTIONS, None)
+        agent = ServiceAgent(service, DEFAULT_OPTIONS, FakeRunningContext())
         agent.run_image()
         assert len(self.docker._services_started) == 1
         _, service, _ = self.docker._services_started[0]
@@ -110,8 +110,7 @@ class ServiceAgentTests(unittest.TestCase):
             FakeService(), DEFAULT_OPTIONS, FakeRunningContext()
         )
         assert agent.status == "null"
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert agent.status == "started"
 
     def test_agent_status_change_sad_path(self):
@@ -124,13 +123,22 @@ class ServiceAgentTests(unittest.TestCase):
             FakeService(), DEFAULT_OPTIONS, FakeRunningContext()
         )
         assert agent.status == "null"
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert agent.status == "failed"
 
+    def test_in_progress_when_submitted(self):
+        submitted = []
+        fake_context = Bunch(executor=Bunch(submit=submitted.append))
+        agent = ServiceAgent(FakeService(), DEFAULT_OPTIONS, fake_context)
+        agent.start_service()
+        # The agent is not run yet, but should not be picked up again
+        assert submitted == [agent.run]
+        assert agent.status == AgentStatus.IN_PROGRESS
+        assert not agent.can_start
+
     def test_skip_if_running_on_same_network(self):
         service = FakeService()
-        agent = ServiceAgent(service, DEFAULT_OPTIONS, None)
+        agent = ServiceAgent(service, DEFAULT_OPTIONS, FakeRunningContext())
         self.docker._existing_containers = [
             Bunch(
                 status="running",
@@ -148,7 +156,7 @@ class ServiceAgentTests(unittest.TestCase):
 
     def test_start_old_container_if_exists(self):
         service = FakeService()
-        agent = ServiceAgent(service, DEFAULT_OPTIONS, None)
+        agent = ServiceAgent(service, DEFAULT_OPTIONS, FakeRunningContext())
         self.docker._existing_containers = [
             Bunch(
                 status="exited",
@@ -165,7 +173,7 @@ class ServiceAgentTests(unittest.TestCase):
 
     def test_start_new_container_if_old_has_different_tag(self):
         service = FakeService()
-        agent = ServiceAgent(service, DEFAULT_OPTIONS, None)
+        agent = ServiceAgent(service, DEFAULT_OPTIONS, FakeRunningContext())
         self.docker._existing_containers = [
             Bunch(
                 status="exited",
@@ -188,7 +196,7 @@ class ServiceAgentTests(unittest.TestCase):
     def test_start_new_container_if_differing_env_value(self):
         service = FakeService()
         service.env = {"KEY": "some-value"}
-        agent = ServiceAgent(service, DEFAULT_OPTIONS, None)
+        agent = ServiceAgent(service, DEFAULT_OPTIONS, FakeRunningContext())
         self.docker._existing_containers = [
             Bunch(
                 status="exited",
@@ -211,7 +219,7 @@ class ServiceAgentTests(unittest.TestCase):
     def test_start_existing_if_differing_env_value_type_but_not_string(self):
         service = FakeService()
         service.env = {"KEY": 12345}
-        agent = ServiceAgent(service, DEFAULT_OPTIONS, None)
+        agent = ServiceAgent(service, DEFAULT_OPTIONS, FakeRunningContext())
         self.docker._existing_containers = [
             Bunch(
                 status="exited",
@@ -235,7 +243,7 @@ class ServiceAgentTests(unittest.TestCase):
             run_dir="/etc",
             build=[],
         )
-        agent = ServiceAgent(service, options, None)
+        agent = ServiceAgent(service, options, FakeRunningContext())
         restarted = False
 
         def start():
@@ -255,14 +263,29 @@ class ServiceAgentTests(unittest.TestCase):
         assert len(self.docker._services_started) == 1
         assert not restarted
 
+    def test_always_start_new_skips_existing_inspection(self):
+        service = FakeService()
+        service.always_start_new = True
+        agent = ServiceAgent(service, DEFAULT_OPTIONS, FakeRunningContext())
+        # Neither the env nor the image of the existing container are needed
+        self.docker._existing_containers = [
+            Bunch(
+                status="exited",
+                network="the-network",
+                name="{}-testing-123".format(service.name),
+            )
+        ]
+        agent.run_image()
+        assert len(self.docker._services_started) == 1
+        assert self.docker._containers_ran == []
+
     def test_build_on_start(self):
         fake_context = FakeRunningContext()
         fake_service = FakeService()
         fake_service.build_from = "the/service/dir"
         options = attr.evolve(DEFAULT_OPTIONS, build=[fake_service.name])
         agent = ServiceAgent(fake_service, options, fake_context)
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert len(self.docker._images_built) == 1
 
     def test_if_build_from_and_latest(self):
@@ -271,8 +294,7 @@ class ServiceAgentTests(unittest.TestCase):
         fake_service.image = "service:latest"
         fake_service.build_from = "the/service/dir"
         agent = ServiceAgent(fake_service, DEFAULT_OPTIONS, fake_context)
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert len(self.docker._images_built) == 1
 
     def test_pre_start_before_run(self):
@@ -280,16 +302,14 @@ class ServiceAgentTests(unittest.TestCase):
         fake_service = FakeService()
         assert not fake_service.pre_start_called
         agent = ServiceAgent(fake_service, DEFAULT_OPTIONS, fake_context)
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert fake_service.pre_start_called
 
     def test_ping_and_init_after_run(self):
         fake_context = FakeRunningContext()
         fake_service = FakeService()
         agent = ServiceAgent(fake_service, DEFAULT_OPTIONS, fake_context)
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert len(fake_context.started_services) == 1
         assert fake_context.started_services[0].name == "service1"
         assert fake_service.ping_count == 1
@@ -313,8 +333,7 @@ class ServiceAgentTests(unittest.TestCase):
                 name="{}-testing-123".format(service.name),
             )
         ]
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert service.ping_count == 0
         assert not service.init_called
         assert not service.pre_start_called
@@ -333,8 +352,7 @@ class ServiceAgentTests(unittest.TestCase):
                 name="{}-testing-123".format(service.name),
             )
         ]
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert service.ping_count == 1
         assert not service.init_called
         assert self.docker._containers_ran == ["longass-container-id"]
@@ -345,10 +363,10 @@ class ServiceAgentTests(unittest.TestCase):
         fake_context = FakeRunningContext()
         fake_service = FakeService(fail_ping=True)
         agent = ServiceAgent(fake_service, DEFAULT_OPTIONS, fake_context)
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert fake_service.ping_count == 3
         assert mock_time.sleep.call_count == 3
+        assert [x.args[0] for x in mock_time.sleep.call_args_list] == [0.01, 0.02, 0.04]
         assert agent.status == AgentStatus.FAILED
         assert len(fake_context.failed_services) == 1
         assert fake_context.failed_services[0] is fake_service
@@ -365,8 +383,7 @@ class ServiceAgentTests(unittest.TestCase):
             build=[],
         )
         agent = ServiceAgent(fake_service, options, fake_context)
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert fake_service.ping_count > 0
         assert fake_context.started_services == []
         assert len(fake_context.failed_services) == 1
@@ -393,8 +410,7 @@ class ServiceAgentTests(unittest.TestCase):
             build=[],
         )
         agent = ServiceAgent(CrazyFakeService(name=name), options, fake_context)
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert container.stopped
         assert container.removed_at is not None
         # This is 0 because the service wasn't stopped by the user
@@ -404,8 +420,7 @@ class ServiceAgentTests(unittest.TestCase):
         fake_context = FakeRunningContext()
         fake_service = FakeService(exception_at_init=ValueError)
         agent = ServiceAgent(fake_service, DEFAULT_OPTIONS, fake_context)
-        agent.start_service()
-        agent.join()
+        agent.start_service().result()
         assert fake_service.ping_count > 0
         assert fake_context.started_services == []
         assert len(fake_context.failed_services) == 1
@@ -415,8 +430,7 @@ class ServiceAgentTests(unittest.TestCase):
         fake_context = FakeRunningContext()
         fake_service = FakeService(exception_at_init=ValueError)
         agent = ServiceAgent(fake_service, DEFAULT_OPTIONS, fake_context)
-        agent.stop_service()
-        agent.join()
+        agent.stop_service().result()
         assert agent.status == AgentStatus.STOPPED
 
     def test_stop_existing_container(self):
@@ -429,13 +443,62 @@ class ServiceAgentTests(unittest.TestCase):
         )
         self.docker._existing_containers = [container]
         agent = ServiceAgent(fake_service, DEFAULT_OPTIONS, fake_context)
-        agent.stop_service()
-        agent.join()
+        agent.stop_service().result()
         assert agent.status == AgentStatus.STOPPED
         assert container.stopped
         assert len(fake_context.stopped_services) == 1
         assert fake_context.stopped_services[0] is fake_service
 
+    def test_kill_existing_container_if_force(self):
+        fake_context = FakeRunningContext()
+        fake_service = FakeService()
+        container = FakeContainer(
+            name="{}-testing-5678".format(fake_service.name),
+            network="the-network",
+            status="running",
+        )
+        self.docker._existing_containers = [container]
+        options = attr.evolve(DEFAULT_OPTIONS, force=True)
+        agent = ServiceAgent(fake_service, options, fake_context)
+        agent.stop_service().result()
+        assert agent.status == AgentStatus.STOPPED
+        assert container.killed
+        assert not container.stopped
+
+    def test_dont_kill_container_exited_since_listing(self):
+        fake_context = FakeRunningContext()
+        fake_service = FakeService()
+        container = FakeContainer(
+            name="{}-testing-5678".format(fake_service.name),
+            network="the-network",
+            status="running",
+            status_on_reload="exited",
+        )
+        self.docker._existing_containers = [container]
+        options = attr.evolve(DEFAULT_OPTIONS, force=True, remove=True)
+        agent = ServiceAgent(fake_service, options, fake_context)
+        agent.stop_service().result()
+        assert agent.status == AgentStatus.STOPPED
+        assert not container.killed
+        assert container.removed_at is not None
+
+    def test_stop_container_removed_since_listing(self):
+        fake_context = FakeRunningContext()
+        fake_service = FakeService()
+        container = FakeContainer(
+            name="{}-testing-5678".format(fake_service.name),
+            network="the-network",
+            status="running",
+            removed_externally=True,
+        )
+        self.docker._existing_containers = [container]
+        options = attr.evolve(DEFAULT_OPTIONS, remove=True)
+        agent = ServiceAgent(fake_service, options, fake_context)
+        agent.stop_service().result()
+        assert agent.status == AgentStatus.STOPPED
+        assert not container.stopped
+        assert container.removed_at is None
+
     @patch("miniboss.service_agent.datetime")
     def test_build_image(self, mock_datetime):
         now = datetime.now()
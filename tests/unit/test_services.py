@@ -10,10 +10,17 @@ from unittest.mock import patch
 
 import attr
 import pytest
-from common import DEFAULT_OPTIONS, FakeContainer, FakeDocker
+from common import DEFAULT_OPTIONS, FakeContainer, FakeDocker, FakeService
 from slugify import slugify
 
-from miniboss import Context, exceptions, service_agent, services, types
+from miniboss import (
+    Context,
+    exceptions,
+    running_context,
+    service_agent,
+    services,
+    types,
+)
 from miniboss.service_agent import ServiceAgent
 from miniboss.services import (
     Service,
@@ -223,6 +230,18 @@ class ConnectServicesTests(unittest.TestCase):
         with pytest.raises(ServiceLoadError):
             connect_services(services)
 
+    def test_repeated_names_reported_once(self):
+        services = [
+            Bunch(name="hello", image="hello"),
+            Bunch(name="goodbye", image="hello"),
+            Bunch(name="hello", image="goodbye"),
+            Bunch(name="goodbye", image="goodbye"),
+            Bunch(name="hello", image="howareyou"),
+        ]
+        with pytest.raises(ServiceLoadError) as exc_info:
+            connect_services(services)
+        assert str(exc_info.value) == "Repeated service names: hello,goodbye"
+
     def test_mix_service_and_name(self):
         service_one = Bunch(name="service_one", image="hello", dependencies=[])
         services = [
@@ -244,8 +263,9 @@ class ConnectServicesTests(unittest.TestCase):
             Bunch(name="hello", image="hello", dependencies=[]),
             Bunch(name="goodbye", image="goodbye", dependencies=["not_hello"]),
         ]
-        with pytest.raises(ServiceLoadError):
+        with pytest.raises(ServiceLoadError) as exc_info:
             connect_services(services)
+        assert str(exc_info.value).startswith("Dependency not_hello of service goodbye")
 
     def test_all_good(self):
         services = [
@@ -268,6 +288,14 @@ class ConnectServicesTests(unittest.TestCase):
         assert by_name["goodbye"] in howareyou.dependencies
         assert howareyou._dependants == []
 
+    def test_repeated_dependency_single_dependant(self):
+        services = [
+            Bunch(name="hello", image="hello", dependencies=[]),
+            Bunch(name="goodbye", image="goodbye", dependencies=["hello", "hello"]),
+        ]
+        by_name = connect_services(services)
+        assert by_name["hello"]._dependants == [by_name["goodbye"]]
+
 
 class ServiceCollectionTests(unittest.TestCase):
     def setUp(self):
@@ -276,6 +304,7 @@ class ServiceCollectionTests(unittest.TestCase):
         )
         services.DockerClient = self.docker
         service_agent.DockerClient = self.docker
+        running_context.DockerClient = self.docker
         types.set_group_name("testing")
 
     def tearDown(self):
@@ -316,8 +345,114 @@ class ServiceCollectionTests(unittest.TestCase):
             image = "hello"
             dependencies = ["goodbye"]
 
-        with pytest.raises(ServiceLoadError):
+        with pytest.raises(ServiceLoadError) as exc_info:
             collection.load_definitions()
+        assert str(exc_info.value).endswith("goodbye, hello, howareyou")
+
+    def test_circular_dependency_error_lists_cycles(self):
+        collection = ServiceCollection()
+
+        class NewServiceBase(Service):
+            name = "not used"
+            image = "not used"
+
+        collection._base_class = NewServiceBase
+
+        class ServiceOne(NewServiceBase):
+            name = "hello"
+            image = "hello"
+            dependencies = ["goodbye"]
+
+        class ServiceTwo(NewServiceBase):
+            name = "goodbye"
+            image = "hello"
+            dependencies = ["hello"]
+
+        class ServiceThree(NewServiceBase):
+            name = "howareyou"
+            image = "hello"
+            dependencies = ["hello", "howareyou"]
+
+        class ServiceFour(NewServiceBase):
+            name = "allgood"
+            image = "hello"
+
+        with pytest.raises(ServiceLoadError) as exc_info:
+            collection.load_definitions()
+        message = str(exc_info.value)
+        assert "goodbye, hello" in message
+        assert "howareyou" in message
+        assert "allgood" not in message
+
+    def test_circular_dependency_error_lists_unresolved(self):
+        """If the services cannot be ordered but no cycle is found, the error
+        names the unresolved services"""
+        collection = ServiceCollection()
+        collection.all_by_name = connect_services(
+            [
+                FakeService(name="hello", dependencies=[]),
+                FakeService(name="goodbye", dependencies=["hello"]),
+            ]
+        )
+        collection.all_by_name["hello"]._dependants = []
+        with pytest.raises(ServiceLoadError) as exception_context:
+            collection.check_circular_dependencies()
+        assert (
+            str(exception_context.value)
+            == "Circular dependency detected between: goodbye"
+        )
+
+    def test_diamond_dependencies_not_circular(self):
+        collection = ServiceCollection()
+
+        class NewServiceBase(Service):
+            name = "not used"
+            image = "not used"
+
+        collection._base_class = NewServiceBase
+
+        class ServiceOne(NewServiceBase):
+            name = "hello"
+            image = "hello"
+
+        class ServiceTwo(NewServiceBase):
+            name = "goodbye"
+            image = "hello"
+            dependencies = ["hello"]
+
+        class ServiceThree(NewServiceBase):
+            name = "howareyou"
+            image = "hello"
+            dependencies = ["hello"]
+
+        class ServiceFour(NewServiceBase):
+            name = "allgood"
+            image = "hello"
+            dependencies = ["goodbye", "howareyou"]
+
+        collection.load_definitions()
+        assert len(collection) == 4
+
+    def test_repeated_dependency_not_circular(self):
+        collection = ServiceCollection()
+
+        class NewServiceBase(Service):
+            name = "not used"
+            image = "not used"
+
+        collection._base_class = NewServiceBase
+
+        class ServiceOne(NewServiceBase):
+            name = "hello"
+            image = "hello"
+
+        class ServiceTwo(NewServiceBase):
+            name = "goodbye"
+            image = "hello"
+            dependencies = ["hello", "hello"]
+
+        collection.load_definitions()
+        assert len(collection) == 2
 
     def test_load_services(self):
         collection = ServiceCollection()
@@ -427,6 +562,27 @@ class ServiceCollectionTests(unittest.TestCase):
         # goodbye
         collection.exclude_for_start(["hello", "goodbye"])
 
+    def test_exclude_for_start_repeated_name(self):
+        collection = ServiceCollection()
+
+        class NewServiceBase(Service):
+            name = "not used"
+            image = "not used"
+
+        collection._base_class = NewServiceBase
+
+        class ServiceOne(NewServiceBase):
+            name = "hello"
+            image = "hello"
+
+        class ServiceTwo(NewServiceBase):
+            name = "goodbye"
+            image = "hello"
+
+        collection.load_definitions()
+        collection.exclude_for_start(["hello", "hello"])
+        assert list(collection.all_by_name.keys()) == ["goodbye"]
+
     def test_error_on_stop_dependency_excluded(self):
         collection = ServiceCollection()
 
@@ -592,6 +748,73 @@ class ServiceCollectionTests(unittest.TestCase):
         collection.start_all(DEFAULT_OPTIONS)
         assert self.docker._networks_created == ["the-network"]
 
+    def test_start_all_check_images(self):
+        collection = ServiceCollection()
+
+        class NewServiceBase(Service):
+            name = "not used"
+            image = "not used"
+
+        class ServiceOne(NewServiceBase):
+            name = "hello"
+            image = "shared/image"
+
+        class ServiceTwo(NewServiceBase):
+            name = "goodbye"
+            image = "shared/image"
+
+        class ServiceThree(NewServiceBase):
+            name = "howareyou"
+            image = "howareyou/image:latest"
+            build_from = "howareyou/dir"
+
+        collection._base_class = NewServiceBase
+        collection.load_definitions()
+        collection.start_all(DEFAULT_OPTIONS)
+        assert self.docker._images_checked == [{"shared/image"}]
+        assert self.docker._image_checks_cancelled
+
+    def test_start_all_check_images_not_running(self):
+        container = FakeContainer(
+            name="hello-testing-1234", network="the-network", status="running"
+        )
+        self.docker._existing_containers = [container]
+        collection = ServiceCollection()
+
+        class NewServiceBase(Service):
+            name = "not used"
+            image = "not used"
+
+        class ServiceOne(NewServiceBase):
+            name = "hello"
+            image = "hello/image"
+
+        class ServiceTwo(NewServiceBase):
+            name = "goodbye"
+            image = "goodbye/image"
+
+        collection._base_class = NewServiceBase
+        collection.load_definitions()
+        collection.start_all(DEFAULT_OPTIONS)
+        assert self.docker._images_checked == [{"goodbye/image"}]
+
+    def test_start_all_limit_parallel_runs(self):
+        collection = ServiceCollection()
+
+        class NewServiceBase(Service):
+            name = "not used"
+            image = "not used"
+
+        class ServiceTwo(NewServiceBase):
+            name = "goodbye"
+            image = "goodbye/image"
+
+        collection._base_class = NewServiceBase
+        collection.load_definitions()
+        options = attr.evolve(DEFAULT_OPTIONS, max_parallel_runs=3)
+        collection.start_all(options)
+        assert self.docker._parallel_run_limits == [3]
+
     def test_stop_on_fail(self):
         collection = ServiceCollection()
 
@@ -663,6 +886,36 @@ class ServiceCollectionTests(unittest.TestCase):
         started = collection.start_all(DEFAULT_OPTIONS)
         assert started == ["second-service"]
 
+    def test_start_all_agent_error(self):
+        """An error escaping an agent is logged, does not block start_all, and
+        the service and its dependants are registered as failed"""
+        collection = ServiceCollection()
+
+        class NewServiceBase(Service):
+            name = "not used"
+            image = "not used"
+
+        class TheService(NewServiceBase):
+            name = "howareyou"
+            image = "howareyou/image"
+
+        class OtherService(NewServiceBase):
+            name = "goodbye"
+            image = "goodbye/image"
+            dependencies = ["howareyou"]
+
+        collection._base_class = NewServiceBase
+        collection.load_definitions()
+        with patch.object(
+            ServiceAgent, "start_container", side_effect=ValueError("Oh noes")
+        ):
+            with self.assertLogs("miniboss.services", level="ERROR") as logs:
+                started = collection.start_all(DEFAULT_OPTIONS)
+        assert "Error in service agent" in logs.output[0]
+        assert started == []
+        failed = [x.name for x in collection.running_context.failed_services]
+        assert failed == ["howareyou", "goodbye"]
+
     def test_stop_all_remove_false(self):
         container1 = FakeContainer(
             name="service1-testing-1234",
@@ -730,6 +983,50 @@ class ServiceCollectionTests(unittest.TestCase):
         assert not container2.stopped
         assert self.docker._networks_removed == []
 
+    def test_stop_all_resolve_network_id(self):
+        container = FakeContainer(
+            name="service1-testing-1234", network="the-network", status="running"
+        )
+        self.docker._existing_containers = [container]
+        collection = ServiceCollection()
+
+        class NewServiceBase(Service):
+            name = "not used"
+            image = "not used"
+
+        class ServiceOne(NewServiceBase):
+            name = "service1"
+            image = "howareyou/image"
+
+        collection._base_class = NewServiceBase
+        collection.load_definitions()
+        options = attr.evolve(
+            DEFAULT_OPTIONS, network=Network(name="the-network", id="")
+        )
+        collection.stop_all(options)
+        assert options.network.id == "the-network-id"
+        assert container.stopped
+
+    def test_stop_all_missing_network(self):
+        collection = ServiceCollection()
+
+        class NewServiceBase(Service):
+            name = "not used"
+            image = "not used"
+
+        class ServiceOne(NewServiceBase):
+            name = "service1"
+            image = "howareyou/image"
+
+        collection._base_class = NewServiceBase
+        collection.load_definitions()
+        options = attr.evolve(
+            DEFAULT_OPTIONS, network=Network(name="other-network", id="")
+        )
+        assert collection.stop_all(options) == ["service1"]
+        assert options.network.id == ""
+        assert self.docker._networks_listed[0].id == ""
+
     def test_stop_with_remove_and_order(self):
         container1 = FakeContainer(
             name="service1-testing-1234", network="the-network", status="running"
@@ -1040,6 +1337,22 @@ class ServiceCommandTests(unittest.TestCase):
         services.start_services("/tmp", [], "miniboss", 50)
         assert sentinel == ["one", "two"]
 
+    def test_stop_services_force(self):
+        services.stop_services("/tmp", [], "miniboss", False, 50)
+        assert not self.collection.options.force
+        services.stop_services("/tmp", [], "miniboss", False, 50, force=True)
+        assert self.collection.options.force
+
+    def test_services_max_parallel_runs(self):
+        services.start_services("/tmp", [], "miniboss", 50, max_parallel_runs=3)
+        assert self.collection.options.max_parallel_runs == 3
+        services.stop_services("/tmp", [], "miniboss", False, 50, max_parallel_runs=4)
+        assert self.collection.options.max_parallel_runs == 4
+        services.reload_service(
+            "/tmp", "the-service", "miniboss", False, 50, max_parallel_runs=5
+        )
+        assert self.collection.options.max_parallel_runs == 5
+
     def test_stop_services_network_name_none(self):
         services.stop_services("/tmp", ["test"], None, False, 50)
         assert self.collection.options.network.name == "miniboss-test"
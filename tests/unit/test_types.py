@@ -36,3 +36,27 @@ class GroupNameTests(unittest.TestCase):
         workdir = Path(self.workdir) / "some weird dir"
         types.update_group_name(workdir)
         assert types.group_name == "test-group"
+
+
+class OptionsTests(unittest.TestCase):
+    def test_no_unknown_attributes(self):
+        options = types.Options(
+            network=types.Network(name="the-network", id="the-network-id"),
+            timeout=1,
+            remove=False,
+            run_dir="/etc",
+            build=[],
+        )
+        with pytest.raises(AttributeError):
+            options.timeuot = 5
+
+    def test_max_parallel_runs_at_least_one(self):
+        with pytest.raises(ValueError):
+            types.Options(
+                network=types.Network(name="the-network", id="the-network-id"),
+                timeout=1,
+                remove=False,
+                run_dir="/etc",
+                build=[],
+                max_parallel_runs=0,
+            )